@@ -0,0 +1,162 @@
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from src.sokoban_solver import SokobanSolver, SOLVED
+from src.utilities import read_all_levels_in_folder, deduplicate_levels
+
+COLLECTIONS = ("Sasquatch", "SasquatchII", "SasquatchX", "SasquatchXI")
+
+BENCHMARK_CONFIGURATIONS = {
+    "move-astar-default": ({"search_mode": "move"}, {"heuristic": "default"}),
+    "push-astar-default": ({"search_mode": "push"}, {"heuristic": "default"}),
+    "push-astar-matching": ({"search_mode": "push"}, {"heuristic": "matching"}),
+    "push-astar-pattern": ({"search_mode": "push"}, {"heuristic": "pattern"}),
+    "push-idastar-matching": ({"search_mode": "push"}, {"heuristic": "matching", "mode": "idastar"}),
+    "push-weighted-astar-matching": ({"search_mode": "push"}, {"heuristic": "matching", "mode": "weighted_astar"}),
+    "push-greedy-matching": ({"search_mode": "push"}, {"heuristic": "matching", "mode": "greedy"}),
+    "push-macros-astar-matching": ({"search_mode": "push", "macros": True}, {"heuristic": "matching"}),
+    "push-backward": ({"search_mode": "push"}, {"mode": "backward"}),
+    "push-bidirectional": ({"search_mode": "push"}, {"mode": "bidirectional"}),
+}
+
+DEFAULT_BUDGETS = {"max_expansions": 200000, "time_limit": 60, "memory_limit_mb": 1024}
+
+
+def read_level_collection(file_path):
+    """Read a collection file holding levels separated by blank lines and
+    return (level_matrix, name) pairs, named like the training set files."""
+    collection = os.path.splitext(os.path.basename(file_path))[0]
+    levels, rows = [], []
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file.read().splitlines() + [""]:
+            if line.strip():
+                rows.append(list(line))
+            elif rows:
+                levels.append((rows, f"{collection}_level_{len(levels) + 1}"))
+                rows = []
+    return levels
+
+
+def read_benchmark_levels(data_folder, collections=COLLECTIONS, include_training_sets=True):
+    """Return (level_matrix, name) pairs from the original collections and,
+    optionally, the training sets, with symmetric duplicates dropped."""
+    levels = []
+    for collection in collections:
+        levels.extend(read_level_collection(os.path.join(data_folder, "original_data_set", collection + ".txt")))
+    if include_training_sets:
+        training_folder = os.path.join(data_folder, "training_data")
+        for training_set in sorted(os.listdir(training_folder)):
+            levels.extend(sorted(read_all_levels_in_folder(os.path.join(training_folder, training_set)),
+                                 key=lambda level: level[1]))
+    return deduplicate_levels(levels)
+
+
+def benchmark_level(level_matrix, name, configuration, budgets):
+    """Solve one level under one configuration and return its report record.
+    Run in a fresh worker process, so the peak memory is this level's alone."""
+    solver_options, solve_options = BENCHMARK_CONFIGURATIONS[configuration]
+    start = time.monotonic()
+    record = {"level": name, "configuration": configuration}
+    try:
+        result = SokobanSolver(level_matrix, **solver_options).solve(**solve_options, **budgets)
+    except Exception as error:
+        record.update({"status": "error", "error": repr(error)})
+    else:
+        record.update({"status": result.status,
+                       "solution_length": len(result.solution) if result.status == SOLVED else None})
+        record.update(result.stats)
+    record["wall_time"] = time.monotonic() - start
+    record["peak_memory_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    return record
+
+
+def run_benchmark(levels, configurations=None, budgets=None, report_path=None, max_workers=None):
+    """Run every configuration on every (level_matrix, name) pair and return
+    the records, one per level and configuration, in order of completion.
+    Each run gets a fresh process and the given budgets, DEFAULT_BUDGETS by
+    default. With report_path every record is also written there as a JSON
+    line as soon as it arrives. A process dying, e.g. killed for running
+    out of memory, breaks the pool and every run still in it; those runs are
+    repeated one pool each, and a run whose process dies again is recorded
+    with status "error"."""
+    configurations = list(BENCHMARK_CONFIGURATIONS) if configurations is None else configurations
+    budgets = DEFAULT_BUDGETS if budgets is None else budgets
+    runs = [(level_matrix, name, configuration, budgets)
+            for configuration in configurations for level_matrix, name in levels]
+    records = []
+    report = open(report_path, "w", encoding="utf-8") if report_path is not None else None
+    try:
+        broken = run_in_pool(runs, max_workers, records, report)
+        for run in broken:
+            if run_in_pool([run], 1, records, report):
+                level_matrix, name, configuration, budgets = run
+                add_record({"level": name, "configuration": configuration, "status": "error",
+                            "error": "worker process died", "wall_time": 0.0, "peak_memory_mb": 0.0},
+                           records, report)
+    finally:
+        if report is not None:
+            report.close()
+    return records
+
+
+def run_in_pool(runs, max_workers, records, report):
+    """Run benchmark_level on each run in a fresh pool, adding the records as
+    they complete, and return the runs lost to a broken pool."""
+    broken = []
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1) as executor:
+        futures = {executor.submit(benchmark_level, *run): run for run in runs}
+        for future in as_completed(futures):
+            try:
+                add_record(future.result(), records, report)
+            except BrokenProcessPool:
+                broken.append(futures[future])
+    return broken
+
+
+def add_record(record, records, report):
+    records.append(record)
+    if report is not None:
+        report.write(json.dumps(record) + "\n")
+        report.flush()
+
+
+def read_benchmark_report(report_path):
+    with open(report_path, "r", encoding="utf-8") as report:
+        return [json.loads(line) for line in report if line.strip()]
+
+
+def summarize_benchmark(records):
+    """Return per-configuration totals: levels, solved count, expansions,
+    wall time and the largest peak memory."""
+    summary = {}
+    for record in records:
+        totals = summary.setdefault(record["configuration"], {"levels": 0, "solved": 0, "expansions": 0,
+                                                              "wall_time": 0.0, "peak_memory_mb": 0.0})
+        totals["levels"] += 1
+        totals["solved"] += record["status"] == SOLVED
+        totals["expansions"] += record.get("expansions") or 0
+        totals["wall_time"] += record["wall_time"]
+        totals["peak_memory_mb"] = max(totals["peak_memory_mb"], record["peak_memory_mb"])
+    return summary
+
+
+def find_regressions(baseline_records, records, tolerance=1.25):
+    """Compare records with a baseline run and return the (level,
+    configuration, reason) triples that got worse: levels no longer solved,
+    and solved levels needing more than tolerance times the expansions."""
+    baseline = {(record["level"], record["configuration"]): record for record in baseline_records}
+    regressions = []
+    for record in records:
+        before = baseline.get((record["level"], record["configuration"]))
+        if before is None or before["status"] != SOLVED:
+            continue
+        if record["status"] != SOLVED:
+            regressions.append((record["level"], record["configuration"], "no longer solved"))
+        elif record["expansions"] > tolerance * max(before["expansions"], 1):
+            regressions.append((record["level"], record["configuration"],
+                                f"expansions {before['expansions']} -> {record['expansions']}"))
+    return regressions
@@ -5,12 +5,11 @@ import matplotlib.pyplot as plt
 from src.utilities import *
 
 
-def get_validity_analysis(generated_levels):
+def get_validity_analysis(generated_levels, check_solvable=False, time_limit=60, max_workers=None, cache=None):
     validity_analysis = {"dimension": [0, 0],
                          "player_count": [0, 0],
                          "crate_storage_location_count": [0, 0]}
-                         # "solvable": [0, 0],
-                         # "solution": []}
+    solvable_candidates = []
     for level, file_name in generated_levels:
         validity = check_level_validity(level, get_intended_dimensions_from_filename(file_name), check_solvable=False)
         dimension_check, player_count_check, crate_storage_location_count_check, solvable_check, solution = validity
@@ -23,11 +22,17 @@ def get_validity_analysis(generated_levels):
         if crate_storage_location_count_check:
             validity_analysis["crate_storage_location_count"][0] += 1
         validity_analysis["crate_storage_location_count"][1] += 1
-        # if solvable_check:
-        #     validity_analysis["solvable"][0] += 1
-        # validity_analysis["solvable"][1] += 1
-        # if solution is not None:
-        #     validity_analysis["solution"].append(len(solution))
+        if player_count_check and crate_storage_location_count_check:
+            solvable_candidates.append(level)
+
+    if check_solvable:
+        validity_analysis["solvable"] = [0, len(generated_levels)]
+        validity_analysis["solution"] = []
+        for _, result in check_levels_solvability(solvable_candidates, max_workers=max_workers,
+                                                     time_limit=time_limit, cache=cache):
+            if result.status == SOLVED:
+                validity_analysis["solvable"][0] += 1
+                validity_analysis["solution"].append(len(result.solution))
 
     return validity_analysis
 
@@ -46,6 +51,9 @@ def get_novelty_analysis(data_folder, generated_levels, training_set):
     generated_levels_by_dimensions = convert_levels_to_flattened_numerics_by_dimensions(generated_levels)
     training_set_by_dimensions = convert_levels_to_flattened_numerics_by_dimensions(training_set_levels)
 
+    training_set_hashes = {level_hash(level) for level, _ in training_set_levels}
+    training_duplicates = sum(level_hash(level) in training_set_hashes for level, _ in generated_levels)
+
     novelty_to_training_set = []
     novelty_to_each_other = []
     novelty_to_all = []
@@ -67,14 +75,16 @@ def get_novelty_analysis(data_folder, generated_levels, training_set):
 
     novelty_analysis = {"to_training_set": np.average(novelty_to_training_set),
                         "to_each_other": np.average(novelty_to_each_other),
-                        "to_all": np.average(novelty_to_all)}
+                        "to_all": np.average(novelty_to_all),
+                        "training_duplicates": [training_duplicates, len(generated_levels)]}
 
     return novelty_analysis
 
 
-def analyse_experiment_results(data_folder, training_mode, training_set, n_epochs, temperature, n_generations):
+def analyse_experiment_results(data_folder, training_mode, training_set, n_epochs, temperature, n_generations,
+                               check_solvable=False, cache=None):
     generated_levels = read_all_levels_in_folder(os.path.join(data_folder, "generated_levels", training_mode))
-    validity_analysis = get_validity_analysis(generated_levels)
+    validity_analysis = get_validity_analysis(generated_levels, check_solvable=check_solvable, cache=cache)
     novelty_analysis = get_novelty_analysis(data_folder, generated_levels, training_set)
 
     experiment_analysis = {"training_set": int(training_set.split("-")[2]),
@@ -87,14 +97,15 @@ def analyse_experiment_results(data_folder, training_mode, training_set, n_epoch
     return experiment_analysis
 
 
-def analyse_all_experiment_results(data_folder):
+def analyse_all_experiment_results(data_folder, check_solvable=False, cache=None):
     experiment_results = {}
 
     hypers = read_hypers()
     for training_mode in hypers:
         if "0.5-temp" not in training_mode:
             continue
-        experiment_results[training_mode] = analyse_experiment_results(data_folder, training_mode, *hypers[training_mode].values())
+        experiment_results[training_mode] = analyse_experiment_results(data_folder, training_mode, *hypers[training_mode].values(),
+                                                                       check_solvable=check_solvable, cache=cache)
 
     return experiment_results
 
@@ -103,8 +114,11 @@ def store_experiment_results(experiment_results, folder_path):
     csv_columns = [
         "Training Mode", "Training Set Size", "Epochs", "Temperature", "Generations",
         "Validity Dimension", "Validity Player Count", "Validity Crate Storage Location Count",
-        "Novelty to Training Set", "Novelty to Each Other", "Novelty to All"
+        "Novelty to Training Set", "Novelty to Each Other", "Novelty to All", "Training Set Duplicates"
     ]
+    with_solvable = any("solvable" in value["validity"] for value in experiment_results.values())
+    if with_solvable:
+        csv_columns.insert(csv_columns.index("Validity Crate Storage Location Count") + 1, "Validity Solvable")
 
     csv_data = []
     for key, value in experiment_results.items():
@@ -113,7 +127,11 @@ def store_experiment_results(experiment_results, folder_path):
         data.append(value["validity"]["dimension"][0] / value["validity"]["dimension"][1])
         data.append(value["validity"]["player_count"][0] / value["validity"]["player_count"][1])
         data.append(value["validity"]["crate_storage_location_count"][0] / value["validity"]["crate_storage_location_count"][1])
+        if with_solvable:
+            solvable = value["validity"].get("solvable")
+            data.append(solvable[0] / solvable[1] if solvable else None)
         data.extend([value["novelty"]["to_training_set"], value["novelty"]["to_each_other"], value["novelty"]["to_all"]])
+        data.append(value["novelty"]["training_duplicates"][0] / value["novelty"]["training_duplicates"][1])
         csv_data.append(data)
 
     csv_file = os.path.join(folder_path, "experiment_results.csv")
@@ -76,7 +76,12 @@ class Node:
     the total path_cost (also known as g) to reach the node. Other functions
     may add an f and h value; see best_first_graph_search and astar_search for
     an explanation of how the f and h values are handled. You will not need to
-    subclass this class."""
+    subclass this class.
+    Nodes use __slots__ to keep the frontier of a long search small, with
+    fixed slots for f and h. A slot that has not been set is absent, so
+    memoize still computes f or h on first use and caches it there."""
+
+    __slots__ = ('state', 'parent', 'action', 'path_cost', 'depth', 'f', 'h')
 
     def __init__(self, state, parent=None, action=None, path_cost=0):
         """Create a search tree Node, derived from a parent by an action."""
@@ -260,33 +265,76 @@ def breadth_first_graph_search(problem):
     return None
 
 
-def best_first_graph_search(problem, f, display=False):
+tie_breaks = {'fifo': None,
+              'high_g': lambda node: -node.path_cost,
+              'low_h': lambda node: getattr(node, 'h', 0)}
+
+
+def best_first_graph_search(problem, f, display=False, explored=None, stats=None, tie_break='fifo',
+                            reopen=False):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
     There is a subtlety: the line "f = memoize(f, 'f')" means that the f
     values will be cached on the nodes as they are computed. So after doing
-    a best first search you can examine the f values of the path returned."""
+    a best first search you can examine the f values of the path returned.
+    The closed set maps each expanded state to its path cost. It is a dict
+    unless you pass another mapping as explored, e.g. a TranspositionTable
+    to bound its memory. The frontier doubles as the open table: it maps
+    each state to its node, and a child reaching a queued state with a
+    lower f replaces that node. With reopen, a child reaching an explored
+    state at a lower path cost goes back on the frontier, which keeps A*
+    optimal under an inconsistent heuristic. If stats is a dict, the
+    number of children already explored or in the frontier, how many of
+    them replaced a queued node or reopened an explored state, and the
+    peak frontier and closed set sizes are recorded in it as duplicates,
+    improved, reopened, max_frontier and max_explored.
+    Nodes with an infinite f are never queued, so a heuristic returning
+    inf for a dead state prunes it, and an infinite f at the root means
+    there is no solution.
+    tie_break orders nodes with equal f: 'fifo' takes the oldest first,
+    'high_g' the one with the highest path cost and 'low_h' the one with
+    the lowest h, as cached on the node by astar_search; insertion order
+    settles any tie left."""
+    if tie_break not in tie_breaks:
+        raise ValueError("Unknown tie break: {}".format(tie_break))
     f = memoize(f, 'f')
     node = Node(problem.initial)
-    frontier = PriorityQueue('min', f)
+    frontier = PriorityQueue('min', f, tie_breaks[tie_break])
     frontier.append(node)
-    explored = set()
+    if explored is None:
+        explored = {}
+    if stats is not None:
+        stats.update(duplicates=0, improved=0, reopened=0, max_frontier=1, max_explored=0)
+    if f(node) == np.inf:
+        return None
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
             if display:
                 print(len(explored), "paths have been expanded and", len(frontier), "paths remain in the frontier")
             return node
-        explored.add(node.state)
+        explored[node.state] = node.path_cost
         for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
-                frontier.append(child)
-            elif child in frontier:
+            if child in frontier:
                 if f(child) < frontier[child]:
-                    del frontier[child]
                     frontier.append(child)
+                    if stats is not None:
+                        stats["improved"] += 1
+            elif child.state not in explored:
+                if f(child) < np.inf:
+                    frontier.append(child)
+                continue
+            elif reopen and child.path_cost < explored[child.state] and f(child) < np.inf:
+                frontier.append(child)
+                if stats is not None:
+                    stats["reopened"] += 1
+            if stats is not None:
+                stats["duplicates"] += 1
+        if stats is not None:
+            stats["max_frontier"] = max(stats["max_frontier"], len(frontier))
+            stats["max_explored"] = max(stats["max_explored"], len(explored))
     return None
 
 
@@ -330,66 +378,63 @@ def iterative_deepening_search(problem):
 # Pseudocode from https://webdocs.cs.ualberta.ca/%7Eholte/Publications/MM-AAAI2016.pdf
 
 def bidirectional_search(problem):
+    """MM bidirectional search: meet in the middle from the initial and the
+    goal state, always extending the side whose open state has the lowest
+    priority max(g + h, 2g), and return the cost of the cheapest path, or
+    inf if there is none. Each side keeps the best g of every state it has
+    reached in a dict, and its open states in three indexed priority queues,
+    by priority (ties to lower g), by f and by g, so that picking, updating
+    and closing a state and reading the termination bounds are all O(log n).
+    The states reached but no longer open are that side's closed set."""
     e = 0
     if isinstance(problem, GraphProblem):
         e = problem.find_min_edge()
-    gF, gB = {Node(problem.initial): 0}, {Node(problem.goal): 0}
-    openF, openB = [Node(problem.initial)], [Node(problem.goal)]
-    closedF, closedB = [], []
+    h_values = {}
+
+    def h(state):
+        if state not in h_values:
+            h_values[state] = problem.h(Node(state))
+        return h_values[state]
+
+    def open_queues(start, g):
+        queues = (PriorityQueue('min', lambda s: max(g[s] + h(s), 2 * g[s]), tie=lambda s: g[s]),
+                  PriorityQueue('min', lambda s: g[s] + h(s)),
+                  PriorityQueue('min', lambda s: g[s]))
+        for queue in queues:
+            queue.append(start)
+        return queues
+
+    gF, gB = {problem.initial: 0}, {problem.goal: 0}
+    openF, openB = open_queues(problem.initial, gF), open_queues(problem.goal, gB)
     U = np.inf
 
-    def extend(U, open_dir, open_other, g_dir, g_other, closed_dir):
+    def extend(U, open_dir, open_other, g_dir, g_other):
         """Extend search in given direction"""
-        n = find_key(C, open_dir, g_dir)
-
-        open_dir.remove(n)
-        closed_dir.append(n)
-
-        for c in n.expand(problem):
-            if c in open_dir or c in closed_dir:
-                if g_dir[c] <= problem.path_cost(g_dir[n], n.state, None, c.state):
-                    continue
+        state = open_dir[0].pop()
+        del open_dir[1][state]
+        del open_dir[2][state]
 
-                open_dir.remove(c)
+        for child in Node(state).expand(problem):
+            cost = problem.path_cost(g_dir[state], state, child.action, child.state)
+            if child.state in g_dir and g_dir[child.state] <= cost:
+                continue
 
-            g_dir[c] = problem.path_cost(g_dir[n], n.state, None, c.state)
-            open_dir.append(c)
+            g_dir[child.state] = cost
+            for queue in open_dir:
+                queue.append(child.state)
 
-            if c in open_other:
-                U = min(U, g_dir[c] + g_other[c])
+            if child.state in open_other[0]:
+                U = min(U, cost + g_other[child.state])
 
-        return U, open_dir, closed_dir, g_dir
+        return U
 
-    def find_min(open_dir, g):
-        """Finds minimum priority, g and f values in open_dir"""
-        # pr_min_f isn't forward pr_min instead it's the f-value
-        # of node with priority pr_min.
-        pr_min, pr_min_f = np.inf, np.inf
-        for n in open_dir:
-            f = g[n] + problem.h(n)
-            pr = max(f, 2 * g[n])
-            pr_min = min(pr_min, pr)
-            pr_min_f = min(pr_min_f, f)
+    def find_min(open_dir):
+        """Return the minimum priority, f and g values in open_dir"""
+        return tuple(queue[queue.peek()] for queue in open_dir)
 
-        return pr_min, pr_min_f, min(g.values())
-
-    def find_key(pr_min, open_dir, g):
-        """Finds key in open_dir with value equal to pr_min
-        and minimum g value."""
-        m = np.inf
-        node = Node(-1)
-        for n in open_dir:
-            pr = max(g[n] + problem.h(n), 2 * g[n])
-            if pr == pr_min:
-                if g[n] < m:
-                    m = g[n]
-                    node = n
-
-        return node
-
-    while openF and openB:
-        pr_min_f, f_min_f, g_min_f = find_min(openF, gF)
-        pr_min_b, f_min_b, g_min_b = find_min(openB, gB)
+    while openF[0] and openB[0]:
+        pr_min_f, f_min_f, g_min_f = find_min(openF)
+        pr_min_b, f_min_b, g_min_b = find_min(openB)
         C = min(pr_min_f, pr_min_b)
 
         if U <= max(C, f_min_f, f_min_b, g_min_f + g_min_b + e):
@@ -397,10 +442,10 @@ def bidirectional_search(problem):
 
         if C == pr_min_f:
             # Extend forward
-            U, openF, closedF, gF = extend(U, openF, openB, gF, gB, closedF)
+            U = extend(U, openF, openB, gF, gB)
         else:
             # Extend backward
-            U, openB, closedB, gB = extend(U, openB, openF, gB, gF, closedB)
+            U = extend(U, openB, openF, gB, gF)
 
     return np.inf
 
@@ -415,12 +460,23 @@ greedy_best_first_graph_search = best_first_graph_search
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
 
-def astar_search(problem, h=None, display=False):
+def astar_search(problem, h=None, display=False, explored=None, stats=None, tie_break='fifo', reopen=False):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display)
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display, explored, stats, tie_break,
+                                   reopen)
+
+
+def weighted_astar_search(problem, h=None, weight=2, display=False, explored=None, stats=None, tie_break='fifo',
+                          reopen=False):
+    """Best-first graph search with f(n) = g(n) + weight * h(n). A weight
+    above 1 trades optimality for speed: with an admissible h the solution
+    costs at most weight times the optimum."""
+    h = memoize(h or problem.h, 'h')
+    return best_first_graph_search(problem, lambda n: n.path_cost + weight * h(n), display, explored, stats,
+                                   tie_break, reopen)
 
 
 # ______________________________________________________________________________
@@ -635,6 +691,64 @@ def recursive_best_first_search(problem, h=None):
     return result
 
 
+def iterative_deepening_astar_search(problem, h=None, table=None, progress=None, stats=None):
+    """IDA*: repeated depth-first searches bounded by f = g + h, where each
+    iteration raises the bound to the smallest f that exceeded the last one.
+    Memory is linear in the solution depth: the search is iterative rather
+    than recursive and never revisits a state on the current path. If table
+    is given (a TranspositionTable, say), a state reached again within an
+    iteration at no lower path cost is skipped, so transpositions are not
+    re-explored while memory stays bounded by the table. progress, if given,
+    is called as progress(bound, expanded) at the start of every iteration.
+    If stats is a dict, the children skipped as already on the path or in
+    the table, the deepest path and the fullest table are recorded in it as
+    duplicates, max_frontier and max_explored."""
+    h = memoize(h or problem.h, 'h')
+    root = Node(problem.initial)
+    bound = h(root)
+    expanded = 0
+    if stats is not None:
+        stats.update(duplicates=0, max_frontier=0, max_explored=0)
+    while bound < np.inf:
+        if progress:
+            progress(bound, expanded)
+        if table is not None:
+            table.clear()
+        next_bound = np.inf
+        stack, path, on_path = [iter([root])], [], set()
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                if path:
+                    on_path.discard(path.pop().state)
+                continue
+            f = node.path_cost + h(node)
+            if f > bound:
+                next_bound = min(next_bound, f)
+                continue
+            if problem.goal_test(node.state):
+                return node
+            if table is not None:
+                if table.get(node.state, np.inf) <= node.path_cost:
+                    if stats is not None:
+                        stats["duplicates"] += 1
+                    continue
+                table[node.state] = node.path_cost
+            expanded += 1
+            path.append(node)
+            on_path.add(node.state)
+            children = node.expand(problem)
+            fresh = [child for child in children if child.state not in on_path]
+            stack.append(iter(fresh))
+            if stats is not None:
+                stats["duplicates"] += len(children) - len(fresh)
+                stats["max_frontier"] = max(stats["max_frontier"], len(path))
+                stats["max_explored"] = max(stats["max_explored"], len(table) if table is not None else 0)
+        bound = next_bound
+    return None
+
+
 def hill_climbing(problem):
     """
     [Figure 4.2]
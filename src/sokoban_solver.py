@@ -1,4 +1,82 @@
-from src.search import Problem, astar_search
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import time
+from collections import deque
+
+import numpy as np
+
+from src.search import (Node, Problem, best_first_graph_search, astar_search, weighted_astar_search,
+                        greedy_best_first_graph_search, iterative_deepening_astar_search)
+from src.utils import TranspositionTable
+
+
+class SokobanState:
+    """A bitboard search state: the player cell, the crate bitmask and the
+    64-bit Zobrist key of both. The key is the hash, so hashing a state and
+    rejecting unequal states cost O(1) whatever the board size."""
+
+    __slots__ = ("player", "crates", "key")
+
+    def __init__(self, player, crates, key):
+        self.player = player
+        self.crates = crates
+        self.key = key
+
+    def __repr__(self):
+        return "<SokobanState {} {:#x}>".format(self.player, self.crates)
+
+    def __eq__(self, other):
+        return (isinstance(other, SokobanState) and self.key == other.key
+                and self.player == other.player and self.crates == other.crates)
+
+    def __lt__(self, other):
+        return (self.player, self.crates) < (other.player, other.crates)
+
+    def __hash__(self):
+        return self.key
+
+
+SOLVED = "solved"
+UNSOLVABLE = "unsolvable"
+UNKNOWN = "unknown"
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised inside a search when a solve runs out of expansions, time or
+    memory. The message names the budget that ran out."""
+
+
+class SolveResult:
+    """The outcome of SokobanSolver.solve: a status (SOLVED, UNSOLVABLE or
+    UNKNOWN when a budget ran out), the solution moves if solved, and a dict
+    of search statistics. It is truthy only when the level was solved."""
+
+    def __init__(self, status, solution=None, stats=None):
+        self.status = status
+        self.solution = solution
+        self.stats = stats or {}
+
+    def __repr__(self):
+        return "<SolveResult {} {}>".format(self.status, self.stats)
+
+    def __bool__(self):
+        return self.status == SOLVED
+
+
+def current_rss_mb():
+    """Return the resident set size of this process in megabytes, or the peak
+    size where the current one cannot be read."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
 
 
 class SokobanSolver(Problem):
@@ -7,15 +85,302 @@ class SokobanSolver(Problem):
     __init__, goal_test, and path_cost. Then you will create instances
     of your subclass and solve them with the various search functions."""
 
-    def __init__(self, initial):
+    state_modes = ("grid", "bitboard")
+    search_modes = ("move", "push")
+    heuristics = ("default", "matching", "pattern")
+    solve_modes = ("astar", "idastar", "weighted_astar", "greedy", "bfs", "backward", "bidirectional", "portfolio")
+    portfolio_strategies = (
+        ({"search_mode": "push"}, {"heuristic": "matching", "mode": "weighted_astar"}),
+        ({"search_mode": "push"}, {"heuristic": "default", "mode": "greedy"}),
+        ({"search_mode": "push"}, {"heuristic": "matching", "mode": "idastar"}),
+        ({"search_mode": "push"}, {"mode": "bfs"}),
+        ({"search_mode": "push"}, {"mode": "bidirectional"}),
+    )
+    default_table_memory_mb = 64
+    budget_check_interval = 64
+    pattern_cell_limit = 300
+    pattern_block = 2 ** 18
+    unreachable = 2 ** 16 - 1
+    matching_cache_size = 50000
+    zobrist_seed = 521
+
+    def __init__(self, initial, state_mode=None, search_mode="move", macros=False):
         """The constructor specifies tdhe initial state, and possibly a goal
         state, if there is a unique goal. Your subclass's constructor can add
-        other arguments."""
-        super().__init__((self.convert_state_to_search_state(initial),
-                          self.player_position(initial)))
+        other arguments.
+
+        state_mode selects the search state representation: "grid" keeps the
+        whole level as nested tuples, "bitboard" keeps walls and goals fixed on
+        the solver and represents a state as a SokobanState holding the player
+        cell, the crate bitmask and an incrementally updated Zobrist key.
+
+        search_mode selects the actions: "move" steps the player one cell at a
+        time, "push" makes every action a crate push and stores the player as
+        the top-left cell of its reachable region. Push search needs bitboard
+        states, which is also the state mode it defaults to.
+
+        macros turns on macro pushes in push search. A push into a one-wide
+        tunnel keeps pushing the crate until it leaves the tunnel, and a push
+        onto the entrance of a room holding every goal drives the crate on
+        to the next goal of a precomputed packing order. Path costs count
+        single pushes, but solutions are no longer guaranteed optimal."""
+        if state_mode is None:
+            state_mode = "bitboard" if search_mode == "push" else "grid"
+        if state_mode not in self.state_modes:
+            raise ValueError(f"Unknown state mode: {state_mode}")
+        if search_mode not in self.search_modes:
+            raise ValueError(f"Unknown search mode: {search_mode}")
+        if search_mode == "push" and state_mode != "bitboard":
+            raise ValueError("Push search needs the bitboard state mode")
+        if macros and search_mode != "push":
+            raise ValueError("Macro pushes need the push search mode")
         self.m, self.n = len(initial), max([len(row) for row in initial])
         self.directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+        self.level = initial
+        self.state_mode = state_mode
+        self.search_mode = search_mode
+        self.macros = macros
         self.solution_node = None
+        self.expansions = self.generated = self.deadlock_prunes = 0
+        self.heuristic_time = 0.0
+        self.max_expansions = self.deadline = self.memory_limit_mb = None
+        self.baseline_rss_mb = 0
+        start_player, crates = self.build_bitboard(initial)
+        self.goal_cells = list(self.mask_cells(self.goals))
+        self.push_distances = self.goal_distances()
+        self.nearest_goal = self.push_distances.min(axis=1, initial=self.unreachable).tolist()
+        self.dead = self.dead_squares()
+        self.surplus_crates = crates.bit_count() > len(self.goal_cells)
+        self.matchings = {}
+        self.pattern_database = None
+        self.start_player = start_player
+        self.tunnels = self.tunnel_cells() if macros else bytearray(len(self.floor))
+        self.room_entrance, self.room, self.room_paths, self.room_prefixes = None, 0, {}, {}
+        if macros:
+            self.build_goal_room(start_player)
+        if search_mode == "push":
+            super().__init__(self.make_state(self.canonical_player(start_player, crates), crates))
+        elif state_mode == "bitboard":
+            super().__init__(self.make_state(start_player, crates))
+        else:
+            super().__init__((self.convert_state_to_search_state(initial),
+                              self.player_position(initial)))
+
+    def build_bitboard(self, level):
+        """Precompute the fixed parts of the level and return the initial
+        bitboard state. The grid is padded with a wall border, so a cell index
+        is (i + 1) * width + (j + 1) and every neighbour of a floor cell is a
+        valid index. Cells past the end of a ragged row count as walls. Grid
+        mode uses the fixed tables too."""
+        self.width = self.n + 2
+        size = (self.m + 2) * self.width
+        self.offsets = {(di, dj): di * self.width + dj for di, dj in self.directions}
+        self.offset_list = list(self.offsets.values())
+        self.bits = [1 << cell for cell in range(size)]
+        generator = random.Random(self.zobrist_seed)
+        self.zobrist_players = [generator.getrandbits(64) for _ in range(size)]
+        self.zobrist_crates = [generator.getrandbits(64) for _ in range(size)]
+        self.floor = bytearray(size)
+        self.goals = 0
+        player, crates = None, 0
+        for i, row in enumerate(level):
+            for j, char in enumerate(row):
+                cell = self.cell_index(i, j)
+                if char in " .$@*+":
+                    self.floor[cell] = 1
+                if char in ".*+":
+                    self.goals |= self.bits[cell]
+                if char in "$*":
+                    crates |= self.bits[cell]
+                if char in "@+" and player is None:
+                    player = cell
+        return player, crates
+
+    def make_state(self, player, crates):
+        """Return the SokobanState for player and crates, computing its Zobrist
+        key from scratch. result updates keys incrementally instead."""
+        key = self.zobrist_players[player]
+        for cell in self.mask_cells(crates):
+            key ^= self.zobrist_crates[cell]
+        return SokobanState(player, crates, key)
+
+    def dead_squares(self):
+        """Mark every floor cell from which a crate can never reach a goal,
+        i.e. every floor cell the pull search of goal_distances never reached.
+        Pushes onto them are only pruned without surplus crates, since spare
+        crates may be parked anywhere."""
+        return bytearray(floor and nearest == self.unreachable for floor, nearest in zip(self.floor, self.nearest_goal))
+
+    def tunnel_cells(self):
+        """Mark the floor cells off goal that lie in a one-wide tunnel: bit 1
+        when walls close them above and below, so a crate can only move left
+        or right, and bit 2 when walls close them left and right."""
+        tunnels = bytearray(len(self.floor))
+        for cell, floor in enumerate(self.floor):
+            if floor and not self.goals & self.bits[cell]:
+                if not self.floor[cell - self.width] and not self.floor[cell + self.width]:
+                    tunnels[cell] |= 1
+                if not self.floor[cell - 1] and not self.floor[cell + 1]:
+                    tunnels[cell] |= 2
+        return tunnels
+
+    def build_goal_room(self, player):
+        """Look for a goal room: a region holding every goal that the player
+        starts outside of and that joins the rest of the level through a single
+        entrance cell. If there is one, and every goal can be filled in turn,
+        farthest from the entrance first, from every side a crate can come in
+        from, store the push paths that do it. room_paths maps (goals filled,
+        direction of the push onto the entrance) to the directions that take
+        the crate on from the entrance, and room_prefixes maps the crates in
+        the room after each step of the packing order to the step number."""
+        best = None
+        for entrance, floor in enumerate(self.floor):
+            if not floor or self.goals & self.bits[entrance] or entrance == player:
+                continue
+            for neighbour in [entrance + offset for offset in self.offset_list]:
+                if not self.floor[neighbour]:
+                    continue
+                room = 0
+                for cell in self.reachable_cells(neighbour, self.bits[entrance]):
+                    room |= self.bits[cell]
+                if room & self.goals == self.goals and not room & self.bits[player]:
+                    if best is None or room.bit_count() < best[1].bit_count():
+                        best = (entrance, room)
+        if best is None:
+            return
+        entrance, room = best
+        distances = self.push_distances[entrance]
+        order = sorted(range(len(self.goal_cells)), key=lambda column: -int(distances[column]))
+        outside = 0
+        for cell, floor in enumerate(self.floor):
+            if floor and not room & self.bits[cell] and cell != entrance:
+                outside |= self.bits[cell]
+        paths, filled = {}, 0
+        for step, column in enumerate(order):
+            last = step == len(order) - 1
+            for direction in self.directions:
+                offset = self.offsets[direction]
+                if not outside & self.bits[entrance - offset] or not room & self.bits[entrance + offset]:
+                    continue
+                path = self.room_push_path(entrance, direction, self.goal_cells[column], filled | outside, last)
+                if path is None:
+                    return
+                paths[(step, direction)] = path
+            filled |= self.bits[self.goal_cells[column]]
+        if not paths:
+            return
+        self.room_entrance, self.room, self.room_paths = entrance, room, paths
+        filled = 0
+        for step, column in enumerate(order):
+            self.room_prefixes[filled] = step
+            filled |= self.bits[self.goal_cells[column]]
+
+    def room_push_path(self, entrance, direction, target, blocked, last):
+        """Return the fewest pushes, as directions, that move a crate from the
+        entrance to target, starting with a push along direction and never
+        touching a cell of blocked, or None if there is no such path. Unless
+        this is the last crate, the player must be able to walk back to the
+        entrance afterwards."""
+        offset = self.offsets[direction]
+        start = (entrance + offset, entrance)
+        if blocked & self.bits[start[0]]:
+            return None
+        parents = {(start[0], min(self.reachable_cells(entrance, blocked | self.bits[start[0]]))): None}
+        frontier = [(start, (direction,))]
+        for (crate, player), path in frontier:
+            region = self.reachable_cells(player, blocked | self.bits[crate])
+            if crate == target:
+                if last or entrance in region:
+                    return path
+                continue
+            for next_direction in self.directions:
+                next_offset = self.offsets[next_direction]
+                pushed = crate + next_offset
+                if (crate - next_offset not in region or not self.floor[pushed]
+                        or blocked & self.bits[pushed] or self.dead[pushed]):
+                    continue
+                key = (pushed, min(self.reachable_cells(crate, blocked | self.bits[pushed])))
+                if key not in parents:
+                    parents[key] = (crate, player)
+                    frontier.append(((pushed, crate), path + (next_direction,)))
+        return None
+
+    def goal_distances(self):
+        """Return a (cells, goals) array holding the number of pushes needed to
+        bring a crate from each cell to each goal, found by BFS over pulls from
+        every goal: a crate can come to a cell from the previous cell along a
+        direction when that cell and the one behind it, where the player
+        stands, are floor. Player reachability is otherwise ignored, so the
+        distances are lower bounds. Unreachable pairs hold self.unreachable."""
+        distances = np.full((len(self.floor), len(self.goal_cells)), self.unreachable, dtype=np.uint16)
+        for column, goal in enumerate(self.goal_cells):
+            goal_distances = [self.unreachable] * len(self.floor)
+            goal_distances[goal] = 0
+            frontier = [goal]
+            for cell in frontier:
+                for offset in self.offset_list:
+                    previous = cell - offset
+                    if (self.floor[previous] and self.floor[previous - offset]
+                            and goal_distances[previous] == self.unreachable):
+                        goal_distances[previous] = goal_distances[cell] + 1
+                        frontier.append(previous)
+            distances[:, column] = goal_distances
+        return distances
+
+    def cell_index(self, i, j):
+        return (i + 1) * self.width + j + 1
+
+    def cell_position(self, cell):
+        i, j = divmod(cell, self.width)
+        return i - 1, j - 1
+
+    def reachable_cells(self, player, crates):
+        """Return the cells the player can walk to from player without pushing
+        a crate, in flood fill order."""
+        visited = bytearray(len(self.floor))
+        visited[player] = 1
+        cells = [player]
+        for cell in cells:
+            for offset in self.offset_list:
+                neighbour = cell + offset
+                if self.floor[neighbour] and not visited[neighbour] and not crates & self.bits[neighbour]:
+                    visited[neighbour] = 1
+                    cells.append(neighbour)
+        return cells
+
+    def canonical_player(self, player, crates):
+        """Return the top-left cell of the player's reachable region. Push
+        search stores the player there, so every walk collapses into one state."""
+        return min(self.reachable_cells(player, crates))
+
+    def walk_path(self, start, target, crates):
+        """Return the shortest list of moves that walks the player from start to
+        target without pushing a crate, or None if target is unreachable."""
+        parents = {start: None}
+        frontier = [start]
+        for cell in frontier:
+            if cell == target:
+                break
+            for direction in self.directions:
+                neighbour = cell + self.offsets[direction]
+                if self.floor[neighbour] and neighbour not in parents and not crates & self.bits[neighbour]:
+                    parents[neighbour] = (cell, direction)
+                    frontier.append(neighbour)
+        if target not in parents:
+            return None
+        path = []
+        while parents[target] is not None:
+            target, direction = parents[target]
+            path.append(direction)
+        return list(reversed(path))
+
+    @staticmethod
+    def mask_cells(mask):
+        """Yield the cell indices of the set bits of mask, lowest first."""
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
 
     @staticmethod
     def player_position(state):
@@ -50,8 +415,14 @@ class SokobanSolver(Problem):
         state. The result would typically be a list, but if there are
         many actions, consider yielding them one at a time in an
         iterator, rather than building them all at once."""
+        self.count_expansion()
+        if self.search_mode == "push":
+            return self.push_actions(state)
+        if self.state_mode == "bitboard":
+            return self.bitboard_actions(state)
         player_i, player_j = state[1]
         possible_actions = []
+        crates = None
         for di, dj in self.directions:
             new_i, new_j = player_i + di, player_j + dj
             if 0 <= new_i < self.m and 0 <= new_j < len(state[0][new_i]) and state[0][new_i][new_j] != "#":
@@ -62,14 +433,159 @@ class SokobanSolver(Problem):
                         0 <= new_i + di < self.m and 0 <= new_j + dj < len(state[0][new_i]) and
                         "$" not in state[0][new_i + di][new_j + dj] and
                         "#" not in state[0][new_i + di][new_j + dj]):
-                    possible_actions.append((di, dj))
+                    if crates is None:
+                        crates = self.grid_crates(state)
+                    if self.can_push(self.cell_index(new_i, new_j), self.offsets[(di, dj)], crates):
+                        possible_actions.append((di, dj))
+
+        return possible_actions
+
+    def grid_crates(self, state):
+        """Return the crate bitmask of a grid state, for the deadlock checks."""
+        crates = 0
+        for i, row in enumerate(state[0]):
+            for j, cell in enumerate(row):
+                if "$" in cell:
+                    crates |= self.bits[self.cell_index(i, j)]
+        return crates
+
+    def count_expansion(self):
+        """Count an expansion and raise SearchBudgetExceeded once the running
+        solve is over one of its budgets. Time and memory are only looked at
+        every budget_check_interval expansions; solve also checks the time
+        after every heuristic evaluation, which can take longer than an
+        expansion on large levels."""
+        if self.max_expansions is not None and self.expansions >= self.max_expansions:
+            raise SearchBudgetExceeded("expansions")
+        self.expansions += 1
+        if self.expansions % self.budget_check_interval == 0:
+            self.check_budgets()
+
+    def check_budgets(self):
+        """Raise SearchBudgetExceeded once the running solve is over its time
+        or memory budget."""
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchBudgetExceeded("time")
+        if self.memory_limit_mb is not None and current_rss_mb() - self.baseline_rss_mb > self.memory_limit_mb:
+            raise SearchBudgetExceeded("memory")
+
+    def bitboard_actions(self, state):
+        player, crates = state.player, state.crates
+        possible_actions = []
+        for direction in self.directions:
+            offset = self.offsets[direction]
+            target = player + offset
+            if not self.floor[target]:
+                continue
+            if not crates & self.bits[target]:
+                possible_actions.append(direction)
+            elif self.can_push(target, offset, crates):
+                possible_actions.append(direction)
+
+        return possible_actions
+
+    def push_actions(self, state):
+        """Return every push available from the player's reachable region as a
+        (crate cell, directions) pair. Without macros every directions tuple
+        holds a single push."""
+        player, crates = state.player, state.crates
+        possible_actions = []
+        for cell in self.reachable_cells(player, crates):
+            for direction in self.directions:
+                offset = self.offsets[direction]
+                crate = cell + offset
+                if crates & self.bits[crate] and self.can_push(crate, offset, crates):
+                    if self.macros:
+                        possible_actions.append((crate, self.macro_path(crate, direction, crates)))
+                    else:
+                        possible_actions.append((crate, (direction,)))
 
         return possible_actions
 
+    def macro_path(self, crate, direction, crates):
+        """Return the directions of the macro push that starts by pushing crate
+        along direction: into the goal room when the crate lands on its
+        entrance and the room holds the crates of a packing step, through
+        the tunnel when it lands in one, and a single push otherwise."""
+        offset = self.offsets[direction]
+        target = crate + offset
+        if target == self.room_entrance:
+            step = self.room_prefixes.get(crates & self.room)
+            if step is not None and (step, direction) in self.room_paths:
+                return (direction,) + self.room_paths[(step, direction)]
+        axis = 1 if offset in (1, -1) else 2
+        path = [direction]
+        crates ^= self.bits[crate] | self.bits[target]
+        while self.tunnels[target] & axis and self.can_push(target, offset, crates):
+            crates ^= self.bits[target] | self.bits[target + offset]
+            target += offset
+            path.append(direction)
+        return tuple(path)
+
+    def can_push(self, crate, offset, crates):
+        """Return True if the crate can be pushed by offset without landing on
+        a wall, another crate or a dead square, or creating a deadlock. With
+        surplus crates only walls and crates stop it, as a spare crate may
+        end up anywhere."""
+        target = crate + offset
+        if not self.floor[target] or crates & self.bits[target]:
+            return False
+        if self.surplus_crates:
+            return True
+        if self.dead[target] or self.is_deadlock(target, crates ^ (self.bits[crate] | self.bits[target])):
+            self.deadlock_prunes += 1
+            return False
+        return True
+
+    def is_deadlock(self, crate, crates):
+        """Return True if the crate that just moved to cell crate is part of a
+        2x2 block or a freeze deadlock. Only the neighbourhood of that crate is
+        examined, so the cost does not grow with the size of the board."""
+        for row_offset in (-self.width, self.width):
+            for column_offset in (-1, 1):
+                block = (crate, crate + row_offset, crate + column_offset, crate + row_offset + column_offset)
+                if all(not self.floor[cell] or crates & self.bits[cell] for cell in block):
+                    if any(self.floor[cell] and not self.goals & self.bits[cell] for cell in block):
+                        return True
+
+        frozen = []
+        if not self.is_frozen(crate, crates, set(), frozen):
+            return False
+        return any(not self.goals & self.bits[cell] for cell in frozen)
+
+    def is_frozen(self, crate, crates, path, frozen):
+        """Return True if the crate can move along neither axis. Crates on the
+        current recursion path are treated as walls, which breaks cycles
+        between crates that block each other. Frozen crates are added to
+        frozen only once the whole check succeeds."""
+        path.add(crate)
+        found = []
+        result = (self.is_blocked(crate, 1, crates, path, found)
+                  and self.is_blocked(crate, self.width, crates, path, found))
+        path.discard(crate)
+        if result:
+            frozen.extend(found)
+            frozen.append(crate)
+        return result
+
+    def is_blocked(self, crate, offset, crates, path, frozen):
+        """Return True if the crate cannot move along the axis given by offset."""
+        sides = (crate - offset, crate + offset)
+        if any(not self.floor[side] or side in path for side in sides):
+            return True
+        if self.dead[sides[0]] and self.dead[sides[1]]:
+            return True
+        return any(crates & self.bits[side] and self.is_frozen(side, crates, path, frozen) for side in sides)
+
     def result(self, state, action):
         """Return the state that results from executing the given
         action in the given state. The action must be one of
         self.actions(state)."""
+        self.generated += 1
+        if self.search_mode == "push":
+            return self.push_result(state, action)
+        if self.state_mode == "bitboard":
+            return self.bitboard_result(state, action)
         player_i, player_j = state[1]
         di, dj = action
         new_i, new_j = player_i + di, player_j + dj
@@ -84,11 +600,102 @@ class SokobanSolver(Problem):
 
         return self.state_to_tuple(new_state), (new_i, new_j)
 
+    def bitboard_result(self, state, action):
+        offset = self.offsets[action]
+        target = state.player + offset
+        crates = state.crates
+        key = state.key ^ self.zobrist_players[state.player] ^ self.zobrist_players[target]
+        if crates & self.bits[target]:
+            crates ^= self.bits[target] | self.bits[target + offset]
+            key ^= self.zobrist_crates[target] ^ self.zobrist_crates[target + offset]
+        return SokobanState(target, crates, key)
+
+    def push_result(self, state, action):
+        crate, directions = action
+        target = crate + sum([self.offsets[direction] for direction in directions])
+        crates = state.crates ^ (self.bits[crate] | self.bits[target])
+        player = self.canonical_player(target - self.offsets[directions[-1]], crates)
+        key = (state.key ^ self.zobrist_crates[crate] ^ self.zobrist_crates[target]
+               ^ self.zobrist_players[state.player] ^ self.zobrist_players[player])
+        return SokobanState(player, crates, key)
+
+    def path_cost(self, c, state1, action, state2):
+        """Count every push of a macro push, and one for any other action."""
+        if self.search_mode == "push":
+            return c + len(action[1])
+        return c + 1
+
+    def pull_actions(self, state):
+        """Return every pull (crate cell, direction) available from the
+        player's reachable region: the player stands next to the crate on
+        the side of direction and steps back, dragging the crate one cell
+        along direction. Pulls only bring crates onto cells that some
+        starting crate can be pushed to."""
+        self.count_expansion()
+        player, crates = state.player, state.crates
+        region = self.reachable_cells(player, crates)
+        visited = set(region)
+        possible_actions = []
+        for cell in region:
+            for direction in self.directions:
+                offset = self.offsets[direction]
+                crate = cell - offset
+                behind = cell + offset
+                if (crates & self.bits[crate] and behind in visited and self.pushable[cell]):
+                    possible_actions.append((crate, direction))
+
+        return possible_actions
+
+    def pull_result(self, state, action):
+        self.generated += 1
+        crate, direction = action
+        offset = self.offsets[direction]
+        target = crate + offset
+        crates = state.crates ^ (self.bits[crate] | self.bits[target])
+        player = self.canonical_player(target + offset, crates)
+        key = (state.key ^ self.zobrist_crates[crate] ^ self.zobrist_crates[target]
+               ^ self.zobrist_players[state.player] ^ self.zobrist_players[player])
+        return SokobanState(player, crates, key)
+
+    def pull_to_push(self, action):
+        """Return the push that undoes the pull action."""
+        crate, (di, dj) = action
+        return crate + self.offsets[(di, dj)], ((-di, -dj),)
+
+    def pushable_cells(self):
+        """Mark the cells some starting crate can be pushed to, by BFS over
+        pushes from every starting crate with player reachability ignored."""
+        pushable = bytearray(len(self.floor))
+        frontier = list(self.mask_cells(self.initial.crates))
+        for cell in frontier:
+            pushable[cell] = 1
+        for cell in frontier:
+            for offset in self.offset_list:
+                target = cell + offset
+                if self.floor[target] and self.floor[cell - offset] and not pushable[target]:
+                    pushable[target] = 1
+                    frontier.append(target)
+        return pushable
+
+    def goal_states(self):
+        """Return the solved states backward search starts from: every goal
+        holds a crate and the player stands in any of the regions left free."""
+        states, seen = [], bytearray(len(self.floor))
+        for cell, floor in enumerate(self.floor):
+            if floor and not seen[cell] and not self.goals & self.bits[cell]:
+                region = self.reachable_cells(cell, self.goals)
+                for reached in region:
+                    seen[reached] = 1
+                states.append(self.make_state(min(region), self.goals))
+        return states
+
     def goal_test(self, state):
         """Return True if the state is a goal. The default method compares the
         state to self.goal or checks for state in self.goal if it is a
         list, as specified in the constructor. Override this method if
         checking against a single self.goal is not enough."""
+        if self.state_mode == "bitboard":
+            return state.crates & self.goals == self.goals
         return len(SokobanSolver.get_unplaced_crate_locations(state)) == 0
 
     @staticmethod
@@ -113,26 +720,550 @@ class SokobanSolver(Problem):
     def manhattan_distance(a, b):
         return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
-    @staticmethod
-    def h(node):
-        """Return the heuristic value for a given state. Default is 0."""
-        unplaced_crate_locations = SokobanSolver.get_unplaced_crate_locations(node.state)
-        empty_storage_place_locations = SokobanSolver.get_empty_storage_place_locations(node.state)
-        value = 0
+    def h(self, node):
+        """Return the heuristic value for a given state: the push distances
+        from crates off a goal to their closest goal, summed over as many of
+        those crates as there are empty goals, plus, in move search, the walk
+        to the closest such crate. Distances come from the push distance
+        tables, so walls are taken into account."""
+        if self.state_mode == "bitboard":
+            player, crates = node.state.player, node.state.crates
+            crate_cells = list(self.mask_cells(crates & ~self.goals))
+            empty_goals = (self.goals & ~crates).bit_count()
+        else:
+            player = self.cell_index(*node.state[1])
+            crate_cells = [self.cell_index(i, j) for i, j in self.get_empty_storage_place_locations(node.state)]
+            empty_goals = len(self.get_unplaced_crate_locations(node.state))
+        if not crate_cells or not empty_goals:
+            return 0
 
-        for crate_location in unplaced_crate_locations:
-            for storage_place_location in empty_storage_place_locations:
-                value += SokobanSolver.manhattan_distance(crate_location, storage_place_location)
-        value /= len(unplaced_crate_locations) if len(unplaced_crate_locations) > 0 else 1
-        value += min([SokobanSolver.manhattan_distance(node.state[1], unplaced_crate_location)
-                     for unplaced_crate_location in unplaced_crate_locations]) - 1 if len(unplaced_crate_locations) > 0 else 1
+        nearest = sorted([self.nearest_goal[cell] for cell in crate_cells])[:empty_goals]
+        if nearest[-1] == self.unreachable:
+            return math.inf
+        value = sum(nearest)
+        if self.search_mode == "move":
+            player_location = self.cell_position(player)
+            value += min([SokobanSolver.manhattan_distance(player_location, self.cell_position(cell))
+                          for cell in crate_cells]) - 1
 
         return value
 
-    def solve(self):
-        self.solution_node = astar_search(self, h=self.h)
-        return self.solution_node is not None
+    def matching_h(self, node):
+        """Return the cost of the cheapest assignment of crates to goals over
+        the push distance tables. It never overestimates the number of pushes
+        left. When the parent's assignment is cached, only the row of the crate
+        that moved is recomputed."""
+        crates = node.state.crates
+        if crates not in self.matchings:
+            parent = node.parent.state.crates if node.parent is not None else None
+            if parent is not None and parent in self.matchings and len(self.goal_cells) == parent.bit_count():
+                self.cache_matching(crates, self.update_matching(self.matchings[parent], parent, crates))
+            else:
+                self.cache_matching(crates, self.compute_matching(crates))
+        return self.matchings[crates][-1]
+
+    def pattern_h(self, node):
+        """Return the larger of matching_h and the pair pattern database bound.
+        Every crate is either paired with another, counting the true cost of
+        pushing both to goals, or counted alone at its nearest goal distance.
+        Pairs are picked greedily by how much they add over their two single
+        distances. Pushes of different crates are distinct, so the sum never
+        overestimates; a pair that cannot reach goals at all gives infinity.
+        Without a database, see load_pattern_database, this is matching_h."""
+        matching = self.matching_h(node)
+        if (matching == math.inf or self.pattern_database is None
+                or node.state.crates.bit_count() != len(self.goal_cells)):
+            return matching
+        cells = list(self.mask_cells(node.state.crates))
+        indices = [self.pattern_index[cell] for cell in cells]
+        if not indices or min(indices) < 0:
+            return matching
+        singles = [self.nearest_goal[cell] for cell in cells]
+        pairs = self.pattern_database[np.ix_(indices, indices)].tolist()
+        gains = []
+        for i in range(len(cells)):
+            for j in range(i + 1, len(cells)):
+                if pairs[i][j] == self.unreachable:
+                    return math.inf
+                gain = pairs[i][j] - singles[i] - singles[j]
+                if gain > 0:
+                    gains.append((gain, i, j))
+        value = sum(singles)
+        paired = set()
+        for gain, i, j in sorted(gains, reverse=True):
+            if i not in paired and j not in paired:
+                paired.update((i, j))
+                value += gain
+        return max(matching, value)
+
+    def layout_key(self, region):
+        """Return a hash of the walls, the goals and the player's region,
+        given by its top-left cell, which is all the pattern database
+        depends on."""
+        layout = hashlib.sha256(bytes(self.floor))
+        layout.update(self.width.to_bytes(4, "little"))
+        layout.update(self.goals.to_bytes((len(self.floor) + 7) // 8, "little"))
+        layout.update(region.to_bytes(4, "little"))
+        return layout.hexdigest()
+
+    def load_pattern_database(self, folder=None):
+        """Set up the pair pattern database used by pattern_h: a uint16 array
+        over pairs of crate cells, the cells the player can reach past the
+        walls that are not dead, of the fewest pushes that bring crates on
+        both cells to two goals with no other crates around, or
+        self.unreachable. Building it takes time and memory cubic in the
+        player's cells, so with more than pattern_cell_limit of them there is
+        no database and pattern_h falls back to matching_h. With a folder,
+        the array is stored there as a .npy file named after layout_key and
+        memory-mapped when it already exists, so levels with the same walls
+        and goals, and processes solving them, share one copy."""
+        player_cells = sorted(self.reachable_cells(self.start_player, 0))
+        self.pattern_database = None
+        if len(player_cells) > self.pattern_cell_limit:
+            return
+        crate_cells = [cell for cell in player_cells if not self.dead[cell]]
+        self.pattern_index = [-1] * len(self.floor)
+        for index, cell in enumerate(crate_cells):
+            self.pattern_index[cell] = index
+        path = os.path.join(folder, self.layout_key(player_cells[0]) + ".npy") if folder is not None else None
+        if path is not None and os.path.exists(path):
+            self.pattern_database = np.load(path, mmap_mode="r")
+            return
+        self.pattern_database = self.pair_costs(crate_cells, player_cells)
+        if path is not None:
+            os.makedirs(folder, exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(temporary, self.pattern_database)
+            os.replace(temporary, path)
+
+    def pair_costs(self, crate_cells, player_cells):
+        """Compute the pair pattern database by breadth-first search over pulls
+        from every placement of two crates on goals and every player cell.
+        Player steps cost nothing and pulls cost one, so each layer is
+        closed under steps before its pulls are taken. A state is first
+        reached at its lowest cost, so the first visit of a pair of crate
+        cells, wherever the player is, gives that pair's cost. States are
+        packed into one integer each and expanded with numpy, pattern_block
+        at a time to bound the temporaries; the running solve's time and
+        memory budgets are checked between blocks."""
+        crates, players = len(crate_cells), len(player_cells)
+        player_index = {cell: index for index, cell in enumerate(player_cells)}
+        neighbours = np.array([[player_index.get(cell + offset, -1) for offset in self.offset_list]
+                               for cell in player_cells], dtype=np.int32).reshape(players, len(self.offset_list))
+        opposite = [self.offset_list.index(-offset) for offset in self.offset_list]
+        crate_player = np.array([player_index[cell] for cell in crate_cells], dtype=np.int32)
+        player_crate = np.array([self.pattern_index[cell] for cell in player_cells], dtype=np.int32)
+        costs = np.full(crates * crates, self.unreachable, dtype=np.uint16)
+        visited = np.zeros(crates * crates * players, dtype=bool)
+
+        def unvisited(states):
+            states = np.unique(states[~visited[states]])
+            visited[states] = True
+            return states
+
+        def blocks(states):
+            for start in range(0, states.size, self.pattern_block):
+                self.check_budgets()
+                yield np.divmod(states[start:start + self.pattern_block], np.int32(players))
+
+        def steps(states):
+            for pair, player in blocks(states):
+                moves = neighbours[player]
+                allowed = ((moves >= 0) & (moves != crate_player[pair // crates, None])
+                           & (moves != crate_player[pair % crates, None]))
+                yield unvisited((pair[:, None] * players + moves)[allowed])
+
+        def pulls(states):
+            for pair, player in blocks(states):
+                a, b = np.divmod(pair, np.int32(crates))
+                pair_a, pair_b, moved = crate_player[a], crate_player[b], player_crate[player]
+                for direction in range(len(self.offset_list)):
+                    step, crate = neighbours[player, direction], neighbours[player, opposite[direction]]
+                    allowed = ((step >= 0) & (step != pair_a) & (step != pair_b) & (moved >= 0)
+                               & ((crate == pair_a) | (crate == pair_b)))
+                    other = np.where(crate == pair_a, b, a)
+                    new_pair = np.minimum(moved, other) * crates + np.maximum(moved, other)
+                    yield unvisited((new_pair * players + step)[allowed])
+
+        goals = sorted(self.pattern_index[cell] for cell in self.goal_cells if self.pattern_index[cell] >= 0)
+        every_player = np.arange(players, dtype=np.int32)
+        layer = [(a * crates + b) * players + every_player[(every_player != crate_player[a])
+                                                          & (every_player != crate_player[b])]
+                 for first, a in enumerate(goals) for b in goals[first + 1:]]
+        layer = unvisited(np.concatenate(layer)) if layer else np.zeros(0, dtype=np.int32)
+        cost = 0
+        while layer.size:
+            parts, frontier = [layer], layer
+            while frontier.size:
+                frontier = np.concatenate(list(steps(frontier)))
+                parts.append(frontier)
+            layer = np.concatenate(parts)
+            pairs = np.unique(layer // players)
+            pairs = pairs[costs[pairs] == self.unreachable]
+            costs[pairs] = cost
+            costs[(pairs % crates) * crates + pairs // crates] = cost
+            layer = np.concatenate(list(pulls(layer)) or [np.zeros(0, dtype=np.int32)])
+            cost += 1
+        return costs.reshape(crates, crates)
+
+    def cache_matching(self, crates, matching):
+        if len(self.matchings) >= self.matching_cache_size:
+            self.matchings.clear()
+        self.matchings[crates] = matching
+
+    def compute_matching(self, crates):
+        """Solve the assignment from scratch with the Hungarian method. Rows
+        are crates and columns are goals; when there are more crates than
+        goals, rows and columns swap so that every goal gets a crate."""
+        cells = list(self.mask_cells(crates))
+        if len(cells) < len(self.goal_cells):
+            return cells, None, None, None, math.inf
+        rows, columns = len(cells), len(self.goal_cells)
+        if rows > columns:
+            cost = [[0] * (rows + 1)] + [[0] + row for row in self.push_distances[cells].T.tolist()]
+            rows, columns = columns, rows
+        else:
+            cost = [[0] * (columns + 1)] + [[0] + row for row in self.push_distances[cells].tolist()]
+        u, v, p = [0] * (rows + 1), [0] * (columns + 1), [0] * (columns + 1)
+        for row in range(1, rows + 1):
+            if row % self.budget_check_interval == 0:
+                self.check_budgets()
+            self.assign_row(cost, row, u, v, p)
+        return cells, u, v, p, self.matching_cost(cost, p)
+
+    def update_matching(self, matching, parent, crates):
+        """Return the assignment for crates from the parent's assignment when
+        exactly one crate moved. Only valid when there are as many crates as
+        goals, so that every column is assigned and the duals stay free."""
+        cells, u, v, p, _ = matching
+        old_cell, new_cell = (parent & ~crates).bit_length() - 1, (crates & ~parent).bit_length() - 1
+        row = cells.index(old_cell) + 1
+        cells, u, v, p = list(cells), list(u), list(v), list(p)
+        cells[row - 1] = new_cell
+        cost = [[0] * (len(v))] + [[0] + row for row in self.push_distances[cells].tolist()]
+        p[p.index(row, 1)] = 0
+        u[row] = min(cost[row][column] - v[column] for column in range(1, len(v)))
+        self.assign_row(cost, row, u, v, p)
+        return cells, u, v, p, self.matching_cost(cost, p)
+
+    def matching_cost(self, cost, p):
+        value = 0
+        for column in range(1, len(p)):
+            row = p[column]
+            if row:
+                if cost[row][column] >= self.unreachable:
+                    return math.inf
+                value += cost[row][column]
+        return value
+
+    @staticmethod
+    def assign_row(cost, row, u, v, p):
+        """Add row to the assignment p along a shortest augmenting path,
+        keeping the potentials u and v feasible (Hungarian method)."""
+        columns = len(v) - 1
+        minv = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        way = [0] * (columns + 1)
+        p[0] = row
+        column = 0
+        while True:
+            used[column] = True
+            current_row, delta, next_column = p[column], math.inf, 0
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    reduced = cost[current_row][j] - u[current_row] - v[j]
+                    if reduced < minv[j]:
+                        minv[j], way[j] = reduced, column
+                    if minv[j] < delta:
+                        delta, next_column = minv[j], j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            column = next_column
+            if p[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            p[column] = p[previous]
+            column = previous
+
+    def solve(self, heuristic="default", mode="astar", table_memory_mb=None, replacement="two_tier",
+              progress=None, max_expansions=None, time_limit=None, memory_limit_mb=None, weight=2,
+              stats_path=None, strategies=None, pattern_database_folder=None, tie_break="high_g",
+              reopen=False):
+        """Search for a solution and return a SolveResult.
+
+        mode picks the search. "astar" is A* and "idastar" IDA*.
+        "weighted_astar" is A* with h scaled by weight and "greedy" is
+        greedy best-first search on h alone; both answer solvability
+        quickly, but their solutions need not be optimal. "bfs" searches in
+        order of path cost, i.e. pushes in push search, without a heuristic.
+        "backward" searches over pulls from the solved states and
+        "bidirectional" meets such a search with a forward one; both need
+        push search and solve breadth first. "portfolio" races strategies,
+        portfolio_strategies by default, in separate processes; see
+        solve_portfolio. In the best-first modes tie_break orders nodes with
+        equal f, "fifo", "high_g" or "low_h" as in best_first_graph_search,
+        and with reopen A* and weighted A* put explored states reached again
+        at a lower cost back on the frontier, which keeps A* optimal when the
+        heuristic is not consistent.
+
+        heuristic is "default" for h, "matching" for matching_h or "pattern"
+        for pattern_h; the last two need bitboard states. The pattern
+        database is built, or loaded from pattern_database_folder, before the
+        search starts but within its budgets.
+
+        The A* modes keep their closed set in a dict, or in a
+        TranspositionTable of table_memory_mb megabytes with the given
+        replacement policy when that is set. IDA* always uses such a table,
+        default_table_memory_mb large unless table_memory_mb says otherwise,
+        and calls progress(bound, expanded) every time it raises the f bound.
+        The search stops with an UNKNOWN result after max_expansions
+        expansions, time_limit seconds, or once the process has grown by
+        memory_limit_mb megabytes, whichever comes first. An exhausted search
+        proves the level UNSOLVABLE.
+
+        The result's stats hold the expansions, generated nodes, duplicates
+        and how many of them improved a queued node or reopened a state, the
+        peak frontier and closed set sizes, the time spent in the heuristic
+        and its share of the wall time, the time spent setting up the pattern
+        database, the pushes pruned as deadlocks, and the level size and goal
+        count. With stats_path they are also appended to that file as a JSON
+        line, together with the status."""
+        if heuristic not in self.heuristics:
+            raise ValueError(f"Unknown heuristic: {heuristic}")
+        if mode not in self.solve_modes:
+            raise ValueError(f"Unknown solve mode: {mode}")
+        if mode == "portfolio":
+            return self.solve_portfolio(strategies, max_expansions, time_limit, memory_limit_mb, stats_path)
+        if heuristic in ("matching", "pattern") and self.state_mode != "bitboard":
+            raise ValueError(f"The {heuristic} heuristic needs the bitboard state mode")
+        heuristic_function = {"default": self.h, "matching": self.matching_h, "pattern": self.pattern_h}[heuristic]
+
+        def h(node):
+            started = time.perf_counter()
+            value = heuristic_function(node)
+            self.heuristic_time += time.perf_counter() - started
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                raise SearchBudgetExceeded("time")
+            return value
+
+        start = time.monotonic()
+        self.expansions = self.generated = self.deadlock_prunes = 0
+        self.heuristic_time = 0.0
+        search_stats = {}
+        self.max_expansions, self.memory_limit_mb = max_expansions, memory_limit_mb
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.baseline_rss_mb = current_rss_mb()
+        self.solution_node, exceeded = None, None
+        pattern_time = 0.0
+        try:
+            if heuristic == "pattern":
+                try:
+                    self.load_pattern_database(pattern_database_folder)
+                finally:
+                    pattern_time = time.monotonic() - start
+            if mode == "idastar":
+                table = TranspositionTable(table_memory_mb or self.default_table_memory_mb, replacement)
+                self.solution_node = iterative_deepening_astar_search(self, h=h, table=table, progress=progress,
+                                                                      stats=search_stats)
+            else:
+                explored = TranspositionTable(table_memory_mb, replacement) if table_memory_mb else None
+                if mode == "weighted_astar":
+                    self.solution_node = weighted_astar_search(self, h=h, weight=weight, explored=explored,
+                                                               stats=search_stats, tie_break=tie_break,
+                                                               reopen=reopen)
+                elif mode == "greedy":
+                    self.solution_node = greedy_best_first_graph_search(self, h, explored=explored,
+                                                                        stats=search_stats, tie_break=tie_break)
+                elif mode == "bfs":
+                    self.solution_node = best_first_graph_search(self, lambda node: node.path_cost, explored=explored,
+                                                                 stats=search_stats, tie_break=tie_break)
+                elif mode == "backward":
+                    self.solution_node = self.backward_search(search_stats)
+                elif mode == "bidirectional":
+                    self.solution_node = self.bidirectional_search(search_stats)
+                else:
+                    self.solution_node = astar_search(self, h=h, explored=explored, stats=search_stats,
+                                                      tie_break=tie_break, reopen=reopen)
+        except SearchBudgetExceeded as budget:
+            exceeded = str(budget)
+        finally:
+            self.max_expansions = self.deadline = self.memory_limit_mb = None
+
+        elapsed = time.monotonic() - start
+        stats = {"expansions": self.expansions,
+                 "generated": self.generated,
+                 "duplicates": search_stats.get("duplicates", 0),
+                 "improved": search_stats.get("improved", 0),
+                 "reopened": search_stats.get("reopened", 0),
+                 "max_frontier": search_stats.get("max_frontier", 0),
+                 "max_explored": search_stats.get("max_explored", 0),
+                 "heuristic_time": self.heuristic_time,
+                 "heuristic_share": self.heuristic_time / elapsed if elapsed else 0.0,
+                 "pattern_time": pattern_time,
+                 "deadlock_prunes": self.deadlock_prunes,
+                 "rows": self.m,
+                 "columns": self.n,
+                 "goals": len(self.goal_cells),
+                 "time": elapsed,
+                 "memory_mb": max(0.0, current_rss_mb() - self.baseline_rss_mb),
+                 "budget_exceeded": exceeded}
+        if self.solution_node is not None:
+            result = SolveResult(SOLVED, self.solution(), stats)
+        else:
+            result = SolveResult(UNKNOWN if exceeded else UNSOLVABLE, None, stats)
+        if stats_path is not None:
+            self.write_stats(stats_path, result)
+        return result
+
+    def backward_search(self, stats):
+        """Breadth-first search over pulls from the solved states until the
+        initial state turns up. Return the forward solution node, or None if
+        the pulls run out, which proves the level unsolvable."""
+        return self.bidirectional_search(stats, forward=False)
+
+    def bidirectional_search(self, stats, forward=True):
+        """Breadth-first search over pushes from the initial state and over
+        pulls from the solved states, expanding the smaller frontier each
+        time, until a state generated by one side is in the table of the
+        other. States are normalized, so both sides share keys. Return the
+        forward solution node through the meeting state, or None if either
+        side runs out of states, which proves the level unsolvable. The
+        solution need not be optimal. With forward False only the backward
+        side runs."""
+        if self.search_mode != "push":
+            raise ValueError("Backward search needs the push search mode")
+        if self.initial.crates.bit_count() != len(self.goal_cells):
+            raise ValueError("Backward search needs as many crates as goals")
+        self.pushable = self.pushable_cells()
+        stats.update(duplicates=0, max_frontier=0, max_explored=0)
+        forward_nodes = {self.initial: Node(self.initial)}
+        backward_nodes = {state: Node(state) for state in self.goal_states()}
+        if self.goal_test(self.initial):
+            return forward_nodes[self.initial]
+        if self.initial in backward_nodes:
+            return self.join_paths(forward_nodes[self.initial], backward_nodes[self.initial])
+        forward_frontier = deque(forward_nodes.values()) if forward else deque()
+        backward_frontier = deque(backward_nodes.values())
+        while backward_frontier and (forward_frontier or not forward):
+            if forward and len(forward_frontier) <= len(backward_frontier):
+                frontier, nodes, others = forward_frontier, forward_nodes, backward_nodes
+                actions, result = self.actions, self.result
+            else:
+                frontier, nodes, others = backward_frontier, backward_nodes, forward_nodes
+                actions, result = self.pull_actions, self.pull_result
+            node = frontier.popleft()
+            for action in actions(node.state):
+                state = result(node.state, action)
+                if state in nodes:
+                    stats["duplicates"] += 1
+                    continue
+                child = Node(state, node, action, node.path_cost + 1)
+                nodes[state] = child
+                if state in others:
+                    if nodes is forward_nodes:
+                        return self.join_paths(child, others[state])
+                    return self.join_paths(others[state], child)
+                frontier.append(child)
+            stats["max_frontier"] = max(stats["max_frontier"], len(forward_frontier) + len(backward_frontier))
+            stats["max_explored"] = max(stats["max_explored"], len(forward_nodes) + len(backward_nodes))
+        return None
+
+    def join_paths(self, forward_node, backward_node):
+        """Return the node reached by following forward_node with the pushes
+        that undo the pulls leading to backward_node, last pull first."""
+        node = forward_node
+        while backward_node.parent is not None:
+            action = self.pull_to_push(backward_node.action)
+            node = Node(backward_node.parent.state, node, action, node.path_cost + 1)
+            backward_node = backward_node.parent
+        return node
+
+    def solve_portfolio(self, strategies=None, max_expansions=None, time_limit=None, memory_limit_mb=None,
+                        stats_path=None):
+        """Race strategies, a sequence of (solver options, solve options)
+        pairs, on this level, each in its own process and under the given
+        budgets. Return the first SOLVED or UNSOLVABLE result, with the index
+        of the winning strategy in its stats as strategy, and terminate the
+        other processes. If every strategy comes back UNKNOWN, so does the
+        portfolio, with their stats listed under strategies."""
+        strategies = self.portfolio_strategies if strategies is None else strategies
+        budgets = {"max_expansions": max_expansions, "time_limit": time_limit, "memory_limit_mb": memory_limit_mb}
+        start = time.monotonic()
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=solve_strategy, daemon=True,
+                                           args=(self.level, solver_options, {**solve_options, **budgets},
+                                                 results, index))
+                   for index, (solver_options, solve_options) in enumerate(strategies)]
+        for worker in workers:
+            worker.start()
+        result, unknown = None, [None] * len(workers)
+        try:
+            pending = len(workers)
+            while pending and result is None:
+                try:
+                    index, outcome = results.get(timeout=1)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers) and results.empty():
+                        break
+                    continue
+                pending -= 1
+                if outcome.status == UNKNOWN:
+                    unknown[index] = outcome.stats
+                else:
+                    outcome.stats["strategy"] = index
+                    result = outcome
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            results.close()
+
+        if result is None:
+            result = SolveResult(UNKNOWN, None, {"strategies": unknown})
+        result.stats["time"] = time.monotonic() - start
+        if stats_path is not None:
+            self.write_stats(stats_path, result)
+        return result
+
+    @staticmethod
+    def write_stats(stats_path, result):
+        with open(stats_path, "a", encoding="utf-8") as stats_file:
+            stats_file.write(json.dumps({"status": result.status, **result.stats}, default=str) + "\n")
 
     def solution(self):
-        return self.solution_node.solution() if self.solution_node else None
+        if self.solution_node is None:
+            return None
+        if self.search_mode == "push":
+            return self.expand_pushes(self.solution_node.solution())
+        return self.solution_node.solution()
+
+    def expand_pushes(self, pushes):
+        """Replay a list of pushes from the real start position and return the
+        player moves, walks included, in the same form as move search."""
+        player, crates = self.start_player, self.initial.crates
+        moves = []
+        for crate, directions in pushes:
+            for direction in directions:
+                offset = self.offsets[direction]
+                moves.extend(self.walk_path(player, crate - offset, crates))
+                moves.append(direction)
+                crates ^= self.bits[crate] | self.bits[crate + offset]
+                player = crate
+                crate += offset
+        return moves
+
 
+def solve_strategy(level, solver_options, solve_options, results, index):
+    """Solve level with one portfolio strategy and put (index, SolveResult)
+    on the results queue. Errors come back as UNKNOWN results."""
+    try:
+        result = SokobanSolver(level, **solver_options).solve(**solve_options)
+    except Exception as error:
+        result = SolveResult(UNKNOWN, None, {"error": repr(error)})
+    results.put((index, result))
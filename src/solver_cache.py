@@ -0,0 +1,69 @@
+import hashlib
+import json
+import sqlite3
+
+from src.sokoban_solver import SolveResult, UNKNOWN
+from src.utilities import canonicalize_level, inverse_transform, transform_moves
+
+BUDGET_OPTIONS = ("max_expansions", "time_limit", "memory_limit_mb", "progress", "table_memory_mb", "replacement")
+
+
+class SolverCache:
+    """A persistent SQLite store of solver outcomes, keyed by a hash of the
+    canonical level text and the solver configuration, so rotated, reflected
+    or shifted copies of a level share one entry; solutions are stored in
+    the canonical frame. SOLVED and UNSOLVABLE results do not depend on the
+    search budgets, so they are keyed without the budget options and reused
+    under any budget. UNKNOWN results are keyed with the budgets, so a run
+    with a larger budget searches again."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results "
+                                "(key TEXT PRIMARY KEY, status TEXT, solution TEXT, stats TEXT)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def key(level_hash, config, with_budgets=False):
+        if not with_budgets:
+            config = {section: {name: value for name, value in options.items() if name not in BUDGET_OPTIONS}
+                      for section, options in config.items()}
+        text = level_hash + "\n" + json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, level_matrix, config):
+        """Return the cached SolveResult for the level under config, or None.
+        config maps option groups to option dicts, as built by solver_config."""
+        _, transform, level_hash = canonicalize_level(level_matrix)
+        for with_budgets in (False, True):
+            row = self.connection.execute("SELECT status, solution, stats FROM results WHERE key = ?",
+                                          (self.key(level_hash, config, with_budgets),)).fetchone()
+            if row is not None:
+                break
+        else:
+            return None
+        status, solution, stats = row
+        if solution is not None:
+            solution = transform_moves(json.loads(solution), inverse_transform(transform))
+        return SolveResult(status, solution, json.loads(stats))
+
+    def put(self, level_matrix, config, result):
+        """Store result; UNKNOWN results are only reused under the same budgets."""
+        _, transform, level_hash = canonicalize_level(level_matrix)
+        solution = None
+        if result.solution is not None:
+            solution = json.dumps(transform_moves(result.solution, transform))
+        key = self.key(level_hash, config, with_budgets=result.status == UNKNOWN)
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                (key, result.status, solution,
+                                 json.dumps(result.stats, default=str)))
+        self.connection.commit()
@@ -1,6 +1,20 @@
 import yaml
 import os
-from src.sokoban_solver import SokobanSolver
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from src.sokoban_solver import SokobanSolver, SolveResult, SOLVED, UNSOLVABLE, UNKNOWN
+
+DEFAULT_SOLVER_OPTIONS = {"search_mode": "push"}
+DEFAULT_SOLVE_OPTIONS = {"heuristic": "matching", "mode": "weighted_astar"}
+DEFAULT_SOLVE_BUDGETS = {"time_limit": 60, "memory_limit_mb": 1024}
+
+PLAYER_COUNT = "player_count"
+CRATE_GOAL_COUNT = "crate_goal_count"
+LEAK = "leak"
+CRATE_UNREACHABLE = "crate_unreachable"
+GOAL_UNREACHABLE = "goal_unreachable"
+DEAD_CRATE = "dead_crate"
 
 
 def read_hypers():
@@ -130,6 +144,78 @@ def convert_level_to_numeric(level_matrix):
     return numeric_level
 
 
+def trim_level(level_matrix):
+    """Pad the rows to equal length and strip the rows and columns of empty
+    space around the level."""
+    width = max([len(row) for row in level_matrix], default=0)
+    rows = [list(row) + [" "] * (width - len(row)) for row in level_matrix]
+    filled = [i for i, row in enumerate(rows) if any(cell != " " for cell in row)]
+    if not filled:
+        return []
+    rows = rows[filled[0]:filled[-1] + 1]
+    columns = [j for j in range(width) if any(row[j] != " " for row in rows)]
+    return [row[columns[0]:columns[-1] + 1] for row in rows]
+
+
+def transform_level(level_matrix, transform):
+    """Apply one of the 8 symmetries of the square: transforms 0-3 rotate
+    clockwise that many quarter turns, 4-7 flip left to right first. Short
+    rows are padded with empty space."""
+    width = max([len(row) for row in level_matrix], default=0)
+    rows = [list(row) + [" "] * (width - len(row)) for row in level_matrix]
+    if transform >= 4:
+        rows = [row[::-1] for row in rows]
+    for _ in range(transform % 4):
+        rows = [list(row) for row in zip(*rows[::-1])]
+    return rows
+
+
+def inverse_transform(transform):
+    return transform if transform >= 4 else (4 - transform) % 4
+
+
+def transform_moves(moves, transform):
+    """Map (di, dj) moves into the frame given by transform_level."""
+    transformed = []
+    for di, dj in moves:
+        if transform >= 4:
+            dj = -dj
+        for _ in range(transform % 4):
+            di, dj = dj, -di
+        transformed.append((di, dj))
+    return transformed
+
+
+def canonicalize_level(level_matrix):
+    """Return (canonical_level, transform, level_hash). Levels that differ
+    only by rotation, reflection or surrounding empty space share the same
+    canonical level and hash; transform maps the trimmed level onto it."""
+    trimmed = trim_level(level_matrix)
+    forms = []
+    for transform in range(8):
+        transformed = transform_level(trimmed, transform)
+        forms.append(("\n".join("".join(row) for row in transformed), transform, transformed))
+    text, transform, canonical_level = min(forms, key=lambda form: form[:2])
+    return canonical_level, transform, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def level_hash(level_matrix):
+    return canonicalize_level(level_matrix)[2]
+
+
+def deduplicate_levels(level_list):
+    """Keep the first of every group of symmetric duplicates in a list of
+    (level_matrix, file_name) pairs."""
+    seen = set()
+    unique_levels = []
+    for level, file_name in level_list:
+        key = level_hash(level)
+        if key not in seen:
+            seen.add(key)
+            unique_levels.append((level, file_name))
+    return unique_levels
+
+
 def flatten_level_matrix(level_matrix, m, n):
     flattened_matrix = []
     for row in level_matrix:
@@ -162,7 +248,67 @@ def convert_levels_to_flattened_numerics_by_dimensions(level_list):
     return resulting_dict
 
 
-def check_level_validity(level_matrix, intended_dimensions, check_solvable=True):
+def prefilter_level(level_matrix):
+    """Look for structural faults that make a level unsolvable, in one pass
+    over its cells, and return the reason code of the first one found or
+    None. The faults are: not exactly one player (PLAYER_COUNT), fewer or
+    more crates than goals (CRATE_GOAL_COUNT), a player region that runs
+    off the edge of the map (LEAK), a crate or an empty goal walled off
+    from the player's region (CRATE_UNREACHABLE, GOAL_UNREACHABLE), and a
+    crate off goal in a corner (DEAD_CRATE). As in SokobanSolver, any
+    character that is not a floor character counts as a wall."""
+    def is_floor(i, j):
+        return 0 <= i < len(level_matrix) and 0 <= j < len(level_matrix[i]) and level_matrix[i][j] in " .$@*+"
+
+    players, crates, goals = [], [], []
+    for i, row in enumerate(level_matrix):
+        for j, cell in enumerate(row):
+            if cell in "@+":
+                players.append((i, j))
+            if cell in "$*":
+                crates.append((i, j))
+            if cell in ".*+":
+                goals.append((i, j))
+    if len(players) != 1:
+        return PLAYER_COUNT
+    if len(crates) != len(goals):
+        return CRATE_GOAL_COUNT
+
+    region = {players[0]}
+    frontier = [players[0]]
+    for i, j in frontier:
+        for di, dj in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
+            neighbour = (i + di, j + dj)
+            if not (0 <= neighbour[0] < len(level_matrix) and 0 <= neighbour[1] < len(level_matrix[neighbour[0]])):
+                return LEAK
+            if neighbour not in region and is_floor(*neighbour):
+                region.add(neighbour)
+                frontier.append(neighbour)
+
+    for i, j in crates:
+        if level_matrix[i][j] == "$":
+            if (i, j) not in region:
+                return CRATE_UNREACHABLE
+            if not (is_floor(i - 1, j) and is_floor(i + 1, j)) and not (is_floor(i, j - 1) and is_floor(i, j + 1)):
+                return DEAD_CRATE
+    for i, j in goals:
+        if level_matrix[i][j] == "." and (i, j) not in region:
+            return GOAL_UNREACHABLE
+    return None
+
+
+def build_pattern_databases(level_list, folder):
+    """Build and store in folder the pair pattern database of every level in
+    a list of (level_matrix, file_name) pairs, e.g. a training set, so that
+    solving with heuristic="pattern" and pattern_database_folder=folder
+    only memory-maps them. Levels sharing walls and goals share a file;
+    levels too large for a database, see load_pattern_database, get none."""
+    for level, _ in level_list:
+        SokobanSolver(level, search_mode="push").load_pattern_database(folder)
+
+
+def check_level_validity(level_matrix, intended_dimensions, check_solvable=True, cache=None,
+                         solver_options=None, solve_options=None):
     m, n = get_level_dimensions(level_matrix)
     dimension_check = m == intended_dimensions[0] and n == intended_dimensions[1]
 
@@ -176,13 +322,140 @@ def check_level_validity(level_matrix, intended_dimensions, check_solvable=True)
     crate_storage_location_count_check = actor_counts["$"] == actor_counts["."]
 
     if check_solvable and player_count_check and crate_storage_location_count_check:
-        sokoban_solver = SokobanSolver(level_matrix)
-        solvable_check = sokoban_solver.solve()
-        solution = None
-        if solvable_check:
-            solution = sokoban_solver.solution()
+        result = solve_level_cached(level_matrix, cache, solver_options, solve_options)
+        solvable_check = result.status == SOLVED
+        solution = result.solution
     else:
         solvable_check = False
         solution = None
 
     return dimension_check, player_count_check, crate_storage_location_count_check, solvable_check, solution
+
+
+def solve_level(level_matrix, solver_options=None, solve_options=None):
+    """Solve one level and return its SolveResult. Errors raised while building
+    the solver or searching, e.g. on a level without a player, come back as an
+    UNKNOWN result with the error in its stats instead of propagating.
+    Levels that prefilter_level rejects come back UNSOLVABLE without a
+    search, with the reason code in their stats. Budgets missing from
+    solve_options are taken from DEFAULT_SOLVE_BUDGETS, so a search always
+    ends."""
+    config = solver_config(solver_options, solve_options)
+    solver_options, solve_options = config["solver"], config["solve"]
+    reason = prefilter_level(level_matrix)
+    if reason is not None:
+        return SolveResult(UNSOLVABLE, None, {"prefilter": reason})
+    try:
+        return SokobanSolver(level_matrix, **solver_options).solve(**solve_options)
+    except Exception as error:
+        return SolveResult(UNKNOWN, None, {"error": repr(error)})
+
+
+def solver_config(solver_options=None, solve_options=None):
+    """Return the full solver configuration, as used for cache keys and
+    by solve_level, with DEFAULT_SOLVE_BUDGETS filled in."""
+    solver_options = DEFAULT_SOLVER_OPTIONS if solver_options is None else solver_options
+    solve_options = {**DEFAULT_SOLVE_BUDGETS, **(DEFAULT_SOLVE_OPTIONS if solve_options is None else solve_options)}
+    return {"solver": solver_options, "solve": solve_options}
+
+
+def solve_level_cached(level_matrix, cache=None, solver_options=None, solve_options=None):
+    """Like solve_level, but look the level up in cache, a SolverCache, first
+    and store the new result there."""
+    if cache is None:
+        return solve_level(level_matrix, solver_options, solve_options)
+    config = solver_config(solver_options, solve_options)
+    result = cache.get(level_matrix, config)
+    if result is None:
+        result = solve_level(level_matrix, solver_options, solve_options)
+        cache.put(level_matrix, config, result)
+    return result
+
+
+def solve_level_chunk(chunk, solver_options, solve_options):
+    return [(index, solve_level(level_matrix, solver_options, solve_options)) for index, level_matrix in chunk]
+
+
+def check_levels_solvability(level_matrices, max_workers=None, time_limit=60, memory_limit_mb=1024, chunksize=4,
+                             solver_options=None, solve_options=None, cache=None):
+    """Solve many levels across a process pool and yield (index, SolveResult)
+    pairs, index being the level's position in level_matrices, as soon as
+    each chunk of chunksize levels finishes. Every level gets time_limit
+    seconds of search and memory_limit_mb megabytes of growth; a level that
+    runs out comes back UNKNOWN instead of holding up its worker.
+    max_workers defaults to the number of CPUs. A worker dying, e.g. killed
+    for running out of memory anyway, breaks the pool and every chunk still
+    in it; those levels are retried one pool each, and a level whose worker
+    dies again comes back UNKNOWN.
+    Symmetric duplicates are searched once and levels prefilter_level
+    rejects are not searched at all. With a SolverCache as cache,
+    cached levels are yielded first without searching and new results are
+    stored."""
+    solve_options = dict(DEFAULT_SOLVE_OPTIONS if solve_options is None else solve_options)
+    solve_options.setdefault("time_limit", time_limit)
+    solve_options.setdefault("memory_limit_mb", memory_limit_mb)
+    config = solver_config(solver_options, solve_options)
+    level_matrices = list(level_matrices)
+    indexed_levels = []
+    duplicates = {}
+    for index, level_matrix in enumerate(level_matrices):
+        result = cache.get(level_matrix, config) if cache is not None else None
+        if result is None and prefilter_level(level_matrix) is not None:
+            result = solve_level(level_matrix, solver_options, solve_options)
+        if result is not None:
+            yield index, result
+            continue
+        _, transform, key = canonicalize_level(level_matrix)
+        if key not in duplicates:
+            duplicates[key] = []
+            indexed_levels.append((index, level_matrix))
+        duplicates[key].append((index, transform))
+    if not indexed_levels:
+        return
+
+    def copy_results(index, result):
+        """Yield result for the level at index and each of its duplicates."""
+        copies = duplicates[canonicalize_level(level_matrices[index])[2]]
+        source_transform = copies[0][1]
+        for copy_index, transform in copies:
+            if copy_index == index or result.solution is None:
+                yield copy_index, result
+            else:
+                moves = transform_moves(result.solution, source_transform)
+                moves = transform_moves(moves, inverse_transform(transform))
+                yield copy_index, SolveResult(result.status, moves, result.stats)
+
+    def chunk_results(results):
+        for index, result in results:
+            if cache is not None:
+                cache.put(level_matrices[index], config, result)
+            yield from copy_results(index, result)
+
+    chunks = [indexed_levels[i:i + chunksize] for i in range(0, len(indexed_levels), chunksize)]
+    broken = []
+    for chunk, results in solve_chunks_in_pool(chunks, max_workers, solver_options, solve_options):
+        if results is None:
+            broken.extend([level] for level in chunk)
+        else:
+            yield from chunk_results(results)
+    for chunk in broken:
+        for _, results in solve_chunks_in_pool([chunk], 1, solver_options, solve_options):
+            if results is None:
+                yield from copy_results(chunk[0][0], SolveResult(UNKNOWN, None, {"error": "worker process died"}))
+            else:
+                yield from chunk_results(results)
+
+
+def solve_chunks_in_pool(chunks, max_workers, solver_options, solve_options):
+    """Solve the chunks in a fresh process pool and yield (chunk, results)
+    pairs as they finish, results being None for chunks lost to a broken
+    pool."""
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(solve_level_chunk, chunk, solver_options, solve_options): chunk
+                   for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                results = None
+            yield futures[future], results
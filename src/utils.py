@@ -5,11 +5,13 @@ URL for the Source: https://github.com/aimacode/aima-python
 Provides some utilities widely used by other modules
 """
 
+import array
 import bisect
 import collections
 import collections.abc
 import functools
 import heapq
+import itertools
 import operator
 import os.path
 import random
@@ -729,10 +731,21 @@ class PriorityQueue:
     order) is returned first.
     If order is 'min', the item with minimum f(x) is
     returned first; if order is 'max', then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+    Items are indexed by a dict, so they must be hashable; membership and
+    lookup are O(1), and deleting an item only marks its heap entry, so
+    deleting and re-appending an item (a decrease-key) is O(log n).
+    Appending an item that is already queued replaces it.
+    Items with equal f(x) come out in order of tie(x) when tie is given,
+    then in insertion order; items themselves are never compared."""
 
-    def __init__(self, order='min', f=lambda x: x):
+    removed = object()
+
+    def __init__(self, order='min', f=lambda x: x, tie=None):
         self.heap = []
+        self.tie = tie
+        self.entries = {}
+        self.counter = itertools.count()
         if order == 'min':
             self.f = f
         elif order == 'max':  # now item with max f(x)
@@ -742,7 +755,11 @@ class PriorityQueue:
 
     def append(self, item):
         """Insert item at its correct position."""
-        heapq.heappush(self.heap, (self.f(item), item))
+        if item in self.entries:
+            del self[item]
+        entry = [self.f(item), self.tie(item) if self.tie else 0, next(self.counter), item]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -752,34 +769,159 @@ class PriorityQueue:
     def pop(self):
         """Pop and return the item (with min or max f(x) value)
         depending on the order."""
-        if self.heap:
-            return heapq.heappop(self.heap)[1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        while self.heap:
+            item = heapq.heappop(self.heap)[-1]
+            if item is not self.removed:
+                del self.entries[item]
+                return item
+        raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def peek(self):
+        """Return the item pop would return, without removing it."""
+        while self.heap and self.heap[0][-1] is self.removed:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            raise Exception('Trying to peek into empty PriorityQueue.')
+        return self.heap[0][-1]
 
     def __len__(self):
         """Return current capacity of PriorityQueue."""
-        return len(self.heap)
+        return len(self.entries)
 
     def __contains__(self, key):
         """Return True if the key is in PriorityQueue."""
-        return any([item == key for _, item in self.heap])
+        return key in self.entries
 
     def __getitem__(self, key):
-        """Returns the first value associated with key in PriorityQueue.
+        """Returns the value associated with key in PriorityQueue.
         Raises KeyError if key is not present."""
-        for value, item in self.heap:
-            if item == key:
-                return value
-        raise KeyError(str(key) + " is not in the priority queue")
+        try:
+            return self.entries[key][0]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
 
     def __delitem__(self, key):
-        """Delete the first occurrence of key."""
+        """Delete key by marking its heap entry as removed. The heap is
+        rebuilt once removed entries outnumber live ones."""
         try:
-            del self.heap[[item == key for _, item in self.heap].index(True)]
-        except ValueError:
+            entry = self.entries.pop(key)
+        except KeyError:
             raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
+        entry[-1] = self.removed
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [entry for entry in self.heap if entry[-1] is not self.removed]
+            heapq.heapify(self.heap)
+
+
+class TranspositionTable:
+    """A fixed-size hash table from states to the best path cost seen for
+    them, usable as the closed set of a graph search. Only a 64-bit key is
+    stored, never the state itself: state.key where states carry one, e.g. a
+    Zobrist key, and otherwise hash(state) scrambled over all 64 bits. So
+    memory stays within memory_mb whatever the states look like; two states whose
+    keys collide are taken to be the same. Slots come in buckets of two.
+    With replacement='two_tier' the first slot keeps the entry with the
+    lowest cost and the second always takes the newest entry; with
+    replacement='always' a new entry overwrites its slot. The table starts
+    small and doubles, rehashing its entries, whenever half its slots are
+    taken, until it reaches memory_mb; clearing shrinks it again. A search
+    reaching few states thus never pays for the full table."""
+
+    entry_size = 16
+    initial_buckets = 1024
+
+    def __init__(self, memory_mb=64, replacement='two_tier'):
+        if replacement not in ('two_tier', 'always'):
+            raise ValueError("Replacement must be either 'two_tier' or 'always'.")
+        self.replacement = replacement
+        self.max_buckets = max(1, int(memory_mb * 2 ** 20) // (2 * self.entry_size))
+        self.clear()
+
+    def allocate(self, buckets):
+        self.buckets = buckets
+        self.keys = array.array('Q', [0]) * (2 * buckets)
+        self.costs = array.array('d', [0.0]) * (2 * buckets)
+
+    @staticmethod
+    def key(state):
+        key = getattr(state, 'key', None)
+        if key is None:
+            key = hash(state) & 0xFFFFFFFFFFFFFFFF
+            key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+            key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+            key ^= key >> 31
+        return (key & 0xFFFFFFFFFFFFFFFF) or 1
+
+    def slot(self, state):
+        """Return the slot holding state, or None."""
+        key = self.key(state)
+        first = 2 * (key % self.buckets)
+        if self.keys[first] == key:
+            return first
+        if self.keys[first + 1] == key:
+            return first + 1
+        return None
+
+    def __contains__(self, state):
+        return self.slot(state) is not None
+
+    def __getitem__(self, state):
+        slot = self.slot(state)
+        if slot is None:
+            raise KeyError(str(state) + " is not in the transposition table")
+        return self.costs[slot]
+
+    def get(self, state, default=None):
+        slot = self.slot(state)
+        return default if slot is None else self.costs[slot]
+
+    def __setitem__(self, state, cost):
+        """Record cost for state, keeping the lower cost if it is known."""
+        slot = self.slot(state)
+        if slot is not None:
+            self.costs[slot] = min(self.costs[slot], cost)
+            return
+        if self.size >= self.buckets and self.buckets < self.max_buckets:
+            self.grow()
+        self.insert(self.key(state), cost)
+
+    def insert(self, key, cost):
+        first = 2 * (key % self.buckets)
+        if self.replacement == 'always':
+            self.store(first + ((key // self.buckets) & 1), key, cost)
+        elif not self.keys[first] or cost <= self.costs[first]:
+            if self.keys[first]:
+                self.store(first + 1, self.keys[first], self.costs[first])
+                self.keys[first], self.costs[first] = key, cost
+            else:
+                self.store(first, key, cost)
+        else:
+            self.store(first + 1, key, cost)
+
+    def grow(self):
+        """Double the number of buckets, up to max_buckets, and rehash."""
+        keys, costs = self.keys, self.costs
+        self.allocate(min(2 * self.buckets, self.max_buckets))
+        self.size = 0
+        for key, cost in zip(keys, costs):
+            if key:
+                self.insert(key, cost)
+
+    def store(self, slot, key, cost):
+        if self.keys[slot]:
+            self.overwrites += 1
+        else:
+            self.size += 1
+        self.keys[slot] = key
+        self.costs[slot] = cost
+
+    def __len__(self):
+        """Return the number of occupied slots."""
+        return self.size
+
+    def clear(self):
+        self.allocate(min(self.initial_buckets, self.max_buckets))
+        self.size = self.overwrites = 0
 
 
 # ______________________________________________________________________________
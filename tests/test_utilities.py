@@ -0,0 +1,15 @@
+from src.utilities import level_hash, trim_level
+
+LEVEL = [list(row) for row in ["#######",
+                               "#@ $ .#",
+                               "#######"]]
+
+
+def test_trim_level_strips_only_outer_blank_rows():
+    padded = [[" "] * 9] + [[" "] + row + [" "] for row in LEVEL] + [[" "] * 9]
+    assert trim_level(padded) == LEVEL
+
+
+def test_interior_blank_row_changes_level_hash():
+    split = LEVEL[:2] + [[" "] * 7] + LEVEL[2:]
+    assert level_hash(split) != level_hash(LEVEL)